@@ -3,12 +3,25 @@
 Author: Gary Geng
 '''
 import abc
+import sys
+from bisect import bisect_right
 from dataclasses import dataclass, field
-from typing import List, Optional, Tuple, Union, cast
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union, cast
 from lark.lexer import Token
 from lark.tree import Tree
 
-from stibium.types import SrcRange, SymbolType, Variability
+from stibium.types import SrcPosition, SrcRange, SymbolType, Variability
+
+# Nodes are slotted where dataclasses support it (Python 3.10+), so that each of them does not
+# carry a __dict__. Classes in between that are not dataclasses need to declare `__slots__ = ()`
+# for this to work.
+if TYPE_CHECKING:
+    # type checkers only recognize node classes as dataclasses through the real decorator
+    from dataclasses import dataclass as node_dataclass
+elif sys.version_info >= (3, 10):
+    node_dataclass = dataclass(slots=True)
+else:
+    node_dataclass = dataclass
 
 
 class TreeNode(abc.ABC):
@@ -16,65 +29,103 @@ class TreeNode(abc.ABC):
     This is not a dataclass to avoid inheritance issues. The attributes are there for static
     analysis.
     '''
+    __slots__ = ()
     range: SrcRange
     parent: Optional['TrunkNode']
+    _sibling_index: Optional[int]  # index of self in parent.children, if known
 
     def scan_leaves(self):
         '''Return all the leaf nodes that are descendants of this node (possibly including self)'''
-        for leaf in _scan_leaves(self):
-            yield leaf
+        return _scan_leaves(self)
 
     def next_sibling(self):
-        if self.parent is None:
+        parent = self.parent
+        if parent is None:
             return None
 
-        for index, node in enumerate(self.parent.children):
-            if node is self:
-                if index == len(self.parent.children) - 1:
-                    return None
-                return self.parent.children[index + 1]
-        return None
+        siblings = parent.children
+        index = self._sibling_index
+        if index is None or index >= len(siblings) or siblings[index] is not self:
+            # the index was not recorded when the parent was set, or is stale since the parent was
+            # reassigned; look for it once
+            for index, node in enumerate(siblings):
+                if node is self:
+                    self._sibling_index = index
+                    break
+            else:
+                return None
+
+        index += 1
+        return siblings[index] if index < len(siblings) else None
 
     def check_rep(self):
         pass
 
 
-@dataclass
+@node_dataclass
 class TrunkNode(TreeNode):
     '''A node with children.'''
     range: SrcRange
     children: Tuple[Optional['TreeNode'], ...] = field(repr=False)
     parent: Optional['TrunkNode'] = field(default=None, compare=False, repr=False)
+    _sibling_index: Optional[int] = field(default=None, init=False, compare=False, repr=False)
+    # the non-None children and their start positions; lazily computed by child_at()
+    _nonempty_children: Optional[List['TreeNode']] = field(default=None, init=False,
+                                                           compare=False, repr=False)
+    _child_starts: Optional[List[SrcPosition]] = field(default=None, init=False, compare=False,
+                                                       repr=False)
+
+    def child_at(self, pos: SrcPosition) -> Optional['TreeNode']:
+        '''Return the child whose range contains the given position, or None if there isn't one.
+
+        Since children are ordered by position, this does a binary search on their start positions.
+        '''
+        starts = self._child_starts
+        nonempty = self._nonempty_children
+        if starts is None or nonempty is None:
+            nonempty = [child for child in self.children if child is not None]
+            starts = [child.range.start for child in nonempty]
+            self._nonempty_children = nonempty
+            self._child_starts = starts
+
+        # index of the last child that starts at or before pos
+        index = bisect_right(starts, pos) - 1
+        if index < 0:
+            return None
+        child = nonempty[index]
+        if pos < child.range.end:
+            return child
+        return None
 
     def descendants(self):
-        '''Iterate over all descendants, including self and the None nodes.'''
-        yield self
-        for child in self.children:
-            if child is not None:
-                # if isinstance(child, LeafNode):
-                # faster than isinstance
-                if not hasattr(child, 'children'):
-                    yield child
-                else:
-                    child = cast(TrunkNode, child)
-                    for desc in child.descendants():
-                        yield desc
+        '''Iterate over all descendants in pre-order, including self but excluding None nodes.'''
+        # iterative rather than recursive, to avoid creating a generator per level
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            # faster than isinstance(node, TrunkNode)
+            children = getattr(node, 'children', None)
+            if children is not None:
+                stack.extend(child for child in reversed(children) if child is not None)
 
     def last_leaf(self):
-        for child in reversed(self.children):
-            if child is None:
-                continue
-            if isinstance(child, LeafNode):
-                return child
-
-            assert isinstance(child, TrunkNode)
-            ret = child.last_leaf()
-            if ret is not None:
-                return ret
+        '''Return the last leaf among the descendants, or None if there are no leaves.'''
+        # Children are pushed in order, so the rightmost one is popped first. A trunk without
+        # leaves is passed over, and the search continues with its previous sibling.
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            # faster than isinstance(node, TrunkNode)
+            children = getattr(node, 'children', None)
+            if children is not None:
+                stack.extend(children)
+            elif node is not None:
+                return node
 
         return None
 
-@dataclass
+@node_dataclass
 class LeafNode(TreeNode):
     '''A node without children, corresponding to a token from the lexer.'''
     range: SrcRange
@@ -82,25 +133,27 @@ class LeafNode(TreeNode):
     parent: Optional['TrunkNode'] = field(default=None, compare=False, repr=False)
     prev: Optional['LeafNode'] = field(default=None, compare=False, repr=False)  # previous token
     next: Optional['LeafNode'] = field(default=None, compare=False, repr=False)  # next token
+    _sibling_index: Optional[int] = field(default=None, init=False, compare=False, repr=False)
 
 
 def _scan_leaves(node: TreeNode):
-    # Generator for all the leaves of the tree defined by node.
-    # using this instead of isinstance() for performance
-    if hasattr(node, 'children'):
-        node = cast(TrunkNode, node)
-        for child in node.children:
-            if child is not None:
-                for leaf in _scan_leaves(child):
-                    yield leaf
-    else:
-        # assert isinstance(node, LeafNode)
-        yield node
-
-
-# NOTE don't subclass this because we are using type(...) == ErrorNode instead of isinstance() for
+    # Generator for all the leaves of the tree defined by node, in order. This uses an explicit
+    # stack rather than recursion so that no generator is created per level of the tree.
+    stack: List[TreeNode] = [node]
+    while stack:
+        node = stack.pop()
+        # using this instead of isinstance() for performance
+        children = getattr(node, 'children', None)
+        if children is None:
+            # assert isinstance(node, LeafNode)
+            yield node
+        else:
+            stack.extend(child for child in reversed(children) if child is not None)
+
+
+# NOTE don't subclass this because we are using type(...) is ErrorNode instead of isinstance() for
 # performance reasons
-@dataclass
+@node_dataclass
 class ErrorNode(TrunkNode):
     '''ErrorNode is a tree of tokens that appear before an unexpected token (ErrorToken).
 
@@ -116,9 +169,9 @@ class ErrorNode(TrunkNode):
     pass
 
 
-# NOTE don't subclass this because we are using type(...) == ErrorToken instead of isinstance() for
+# NOTE don't subclass this because we are using type(...) is ErrorToken instead of isinstance() for
 # performance reasons
-@dataclass
+@node_dataclass
 class ErrorToken(LeafNode):
     '''A token that was not expected while parsing. See `ErrorNode`.'''
     pass
@@ -126,22 +179,22 @@ class ErrorToken(LeafNode):
 
 class ArithmeticExpr(TreeNode):
     '''Base class for arithmetic expressions.'''
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@node_dataclass
 class Sum(ArithmeticExpr, TrunkNode):
     '''Arithmetic expression with an addition/subtraction root operator.'''
     pass
 
 
-@dataclass
+@node_dataclass
 class Product(ArithmeticExpr, TrunkNode):
     '''Arithmetic expression with a multiplication/division root operator.'''
     pass
 
 
-@dataclass
+@node_dataclass
 class Power(ArithmeticExpr, TrunkNode):
     '''Arithmetic expression with a power root operator.'''
     pass
@@ -153,7 +206,7 @@ class Power(ArithmeticExpr, TrunkNode):
 #     children: Tuple['Operator', 'Atom'] = field(repr=False)
 
 
-@dataclass
+@node_dataclass
 class Atom(TrunkNode, ArithmeticExpr):
     '''Atomic arithmetic expression.
     
@@ -164,32 +217,40 @@ class Atom(TrunkNode, ArithmeticExpr):
     # rule called Factor that handles that?
 
 
-# NOTE don't subclass this because we are using type(...) == Name instead of isinstance() for
+# NOTE don't subclass this because we are using type(...) is Name instead of isinstance() for
 # performance reasons
 class Name(LeafNode):
+    __slots__ = ()
+
     def check_rep(self):
         assert bool(self.text)
 
 
+@node_dataclass
 class Number(LeafNode, ArithmeticExpr):
+    # cached result of get_value()
+    _value: Optional[float] = field(default=None, init=False, compare=False, repr=False)
+
     def get_value(self):
-        return float(self.text)
+        if self._value is None:
+            self._value = float(self.text)
+        return self._value
     
     def check_rep(self):
         self.get_value()
 
 
-@dataclass
+@node_dataclass
 class Operator(LeafNode):
     pass
 
 
-@dataclass
+@node_dataclass
 class Keyword(LeafNode):
     pass
 
 
-@dataclass
+@node_dataclass
 class StringLiteral(LeafNode):
     def get_str(self):
         '''Get the string within the quotes.'''
@@ -198,12 +259,12 @@ class StringLiteral(LeafNode):
 
 # NOTE for now, the EOF is constructed as a Newline with text being an empty string. In the future,
 # we may want to add a special EOF class
-@dataclass
+@node_dataclass
 class Newline(LeafNode):
     pass
 
 
-@dataclass
+@node_dataclass
 class VarName(TrunkNode):
     '''Represents '$a' or 'a'. See antimony.lark for more info.'''
     children: Tuple[Optional[Operator], Name] = field(repr=False)
@@ -218,9 +279,9 @@ class VarName(TrunkNode):
         return self.children[1].text
 
 
-# NOTE don't subclass this because we are using type(...) == InComp instead of isinstance() for
+# NOTE don't subclass this because we are using type(...) is InComp instead of isinstance() for
 # performance reasons
-@dataclass
+@node_dataclass
 class InComp(TrunkNode):
     '''Represents 'in c'. See antimony.lark for more info.'''
     children: Tuple[Keyword, VarName] = field(repr=False)
@@ -229,7 +290,7 @@ class InComp(TrunkNode):
         return self.children[1]
 
 
-@dataclass
+@node_dataclass
 class NameMaybeIn(TrunkNode):
     '''Represents 'a [in c]'. See antimony.lark for more info.'''
     children: Tuple[VarName, Optional[InComp]] = field(repr=False)
@@ -240,11 +301,14 @@ class NameMaybeIn(TrunkNode):
     def is_in_comp(self):
         return self.children[1] is not None
 
+    def get_incomp(self) -> Optional[InComp]:
+        return self.children[1]
+
     def get_comp(self):
         return self.children[1].get_comp()
 
 
-@dataclass
+@node_dataclass
 class Species(TrunkNode):
     '''A species in a reaction, e.g. [stoich] [$] name.
     
@@ -269,7 +333,7 @@ class Species(TrunkNode):
         return self.get_name().text
 
 
-@dataclass
+@node_dataclass
 class ReactionName(TrunkNode):
     '''Represents the 'J0:' at the start of the reaction.'''
     children: Tuple[NameMaybeIn, Operator] = field(repr=False)
@@ -278,17 +342,26 @@ class ReactionName(TrunkNode):
         return self.children[0]
 
     def get_name(self):
-        return self.get_maybein().get_var_name().get_name()
+        # same as self.get_maybein().get_var_name().get_name(), without the intermediate calls
+        return self.children[0].children[0].children[1]
 
     def get_name_text(self):
-        return self.get_maybein().get_var_name().get_name_text()
+        return self.children[0].children[0].children[1].text
 
 
-@dataclass
+@node_dataclass
 class SpeciesList(TrunkNode):
     '''Represents the list of reactants or the list of products in a reaction.'''
+    # cached result of get_all_species()
+    _species: Optional[List[Species]] = field(default=None, init=False, compare=False, repr=False)
+
     def get_all_species(self) -> List[Species]:
-        return cast(List[Species], self.children[::2])
+        '''Return the list of Species in this list. The returned list is shared; don't modify it.'''
+        species = self._species
+        if species is None:
+            species = cast(List[Species], list(self.children[::2]))
+            self._species = species
+        return species
 
     def check_rep(self):
         assert len(self.children) == 0 or len(self.children) % 2 == 1
@@ -298,7 +371,11 @@ class SpeciesList(TrunkNode):
             assert isinstance(child, LeafNode) and child.text == '+'
 
 
-@dataclass
+# Returned for a missing species list, so that an empty list isn't created on every call
+_EMPTY_SPECIES: Tuple[Species, ...] = ()
+
+
+@node_dataclass
 class Reaction(TrunkNode):
     children: Tuple[Optional[ReactionName], SpeciesList, Operator, SpeciesList, Operator,
                     ArithmeticExpr, Optional[InComp]] = field(repr=False)
@@ -325,27 +402,31 @@ class Reaction(TrunkNode):
         For a list of Species objects, see get_reactants().'''
         return self.children[3]
 
-    def get_reactants(self) -> List[Species]:
+    def get_reactants(self) -> Sequence[Species]:
         slist = self.get_reactant_list()
         if slist:
             return slist.get_all_species()
-        return list()
+        return _EMPTY_SPECIES
 
-    def get_products(self) -> List[Species]:
+    def get_products(self) -> Sequence[Species]:
         slist = self.get_product_list()
         if slist:
             return slist.get_all_species()
-        return list()
+        return _EMPTY_SPECIES
 
     def get_rate_law(self):
         return self.children[5]
 
+    def get_incomp(self) -> Optional[InComp]:
+        '''Get the 'in <compartment>' at the end of the reaction, if any.'''
+        return self.children[6]
+
     def is_reversible(self):
         assert self.children[2].text in ('->', '=>')
         return self.children[2].text == '->'
 
 
-@dataclass
+@node_dataclass
 class Assignment(TrunkNode):
     children: Tuple[NameMaybeIn, Operator, ArithmeticExpr] = field(repr=False)
 
@@ -353,30 +434,39 @@ class Assignment(TrunkNode):
         return self.children[0]
 
     def get_name(self):
-        return self.get_maybein().get_var_name().get_name()
+        # same as self.get_maybein().get_var_name().get_name(), without the intermediate calls
+        return self.children[0].children[0].children[1]
 
     def get_name_text(self):
-        return self.get_maybein().get_var_name().get_name_text()
+        return self.children[0].children[0].children[1].text
 
     def get_value(self):
         return self.children[2]
 
 
-@dataclass
+@node_dataclass
 class VarModifier(Keyword):
     '''Represents var or const in a declaration.'''
     # text: Union[Literal['const'], Literal['var']]
     pass
 
 
-@dataclass
+@node_dataclass
 class TypeModifier(Keyword):
     '''Represents a type name in a declaration.'''
     # text: Union[Literal['species'], Literal['compartment'], Literal['formula']]
     pass
 
 
-@dataclass
+# Maps the text of a TypeModifier to the symbol type it declares
+_TYPE_MODIFIERS = {
+    'species': SymbolType.Species,
+    'compartment': SymbolType.Compartment,
+    'formula': SymbolType.Parameter,
+}
+
+
+@node_dataclass
 class DeclModifiers(TrunkNode):
     '''Represents the prefix modifiers to a declaration.
     
@@ -385,6 +475,9 @@ class DeclModifiers(TrunkNode):
     None.
     '''
     children: Tuple[Optional[VarModifier], Optional[TypeModifier]] = field(repr=False)
+    # cached results of get_variab() and get_type()
+    _variab: Optional[Variability] = field(default=None, init=False, compare=False, repr=False)
+    _type: Optional[SymbolType] = field(default=None, init=False, compare=False, repr=False)
 
     def get_var_modifier(self):
         return self.children[0]
@@ -393,27 +486,30 @@ class DeclModifiers(TrunkNode):
         return self.children[1]
 
     def get_variab(self):
-        var_mod = self.get_var_modifier()
-        if var_mod is None:
-            return Variability.UNKNOWN
-        return Variability.CONSTANT if var_mod.text == 'const' else Variability.VARIABLE
+        if self._variab is None:
+            var_mod = self.get_var_modifier()
+            if var_mod is None:
+                self._variab = Variability.UNKNOWN
+            elif var_mod.text == 'const':
+                self._variab = Variability.CONSTANT
+            else:
+                self._variab = Variability.VARIABLE
+        return self._variab
 
     def get_type(self):
-        type_mod = self.get_type_modifier()
-        if type_mod is None:
-            return SymbolType.Unknown
-
-        return {
-            'species': SymbolType.Species,
-            'compartment': SymbolType.Compartment,
-            'formula': SymbolType.Parameter,
-        }[type_mod.text]
+        if self._type is None:
+            type_mod = self.get_type_modifier()
+            if type_mod is None:
+                self._type = SymbolType.Unknown
+            else:
+                self._type = _TYPE_MODIFIERS[type_mod.text]
+        return self._type
 
     def check_rep(self):
         assert bool(self.children[0]) or bool(self.children[1])
 
 
-@dataclass
+@node_dataclass
 class DeclAssignment(TrunkNode):
     '''Represents an assignment item in a declaration statement. See antimony.lark for more info.'''
     children: Tuple[Operator, ArithmeticExpr] = field(repr=False)
@@ -422,7 +518,7 @@ class DeclAssignment(TrunkNode):
         return self.children[1]
 
 
-@dataclass
+@node_dataclass
 class DeclItem(TrunkNode):
     '''Represents a declaration item in a declaration statement. See antimony.lark for more info.'''
     children: Tuple[NameMaybeIn, DeclAssignment] = field(repr=False)
@@ -434,10 +530,11 @@ class DeclItem(TrunkNode):
         return self.children[1]
 
     def get_name(self):
-        return self.get_maybein().get_var_name().get_name()
+        # same as self.get_maybein().get_var_name().get_name(), without the intermediate calls
+        return self.children[0].children[0].children[1]
 
     def get_name_text(self):
-        return self.get_maybein().get_var_name().get_name_text()
+        return self.children[0].children[0].children[1].text
 
     def get_value(self):
         node = self.get_decl_assignment()
@@ -446,7 +543,7 @@ class DeclItem(TrunkNode):
         return node.get_value()
 
 
-@dataclass
+@node_dataclass
 class Declaration(TrunkNode):
     def get_modifiers(self):
         return cast(DeclModifiers, self.children[0])
@@ -463,15 +560,18 @@ class Declaration(TrunkNode):
 
 
 # TODO All below
-@dataclass
+@node_dataclass
 class Annotation(TrunkNode):
     children: Tuple[VarName, Keyword, StringLiteral]
 
     def get_var_name(self):
         return self.children[0]
 
+    def get_name(self):
+        return self.children[0].children[1]
+
     def get_name_text(self):
-        return self.get_var_name().get_name_text()
+        return self.children[0].children[1].text
 
     def get_keyword(self):
         return self.children[1].text
@@ -480,7 +580,7 @@ class Annotation(TrunkNode):
         return self.children[2].get_str()
 
 
-@dataclass
+@node_dataclass
 class SimpleStmt(TrunkNode):
     children: Tuple[Union[Reaction, Assignment, Declaration, Annotation], Union[Operator, Newline]] = field(repr=False)
 
@@ -489,13 +589,13 @@ class SimpleStmt(TrunkNode):
 
 
 # TODO BEGIN not implemented
-@dataclass
+@node_dataclass
 class Model(TrunkNode):
     def get_name(self):
         assert False, 'Not implemented'
 
 
-@dataclass
+@node_dataclass
 class Function(TrunkNode):
     def get_name(self):
         assert False, 'Not implemented'
@@ -503,6 +603,8 @@ class Function(TrunkNode):
 
 
 # The root node (of an Antimony source file)
-@dataclass
+@node_dataclass
 class FileNode(TrunkNode):
     children: Tuple[SimpleStmt, ...] = field(repr=False)
+    # The compiled symbol table program of this tree. See stibium.codegen
+    program: Optional[List[tuple]] = field(default=None, init=False, compare=False, repr=False)
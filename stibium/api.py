@@ -5,7 +5,7 @@ Author: Gary Geng
 
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import List, Optional, cast
+from typing import List, Optional, Sequence, cast
 from lark.lexer import Token
 from lark.tree import Tree
 from stibium.ant_types import Annotation, NameMaybeIn, Number, Reaction, ReactionName, SpeciesList
@@ -93,11 +93,11 @@ class Completer:
 
         self._completions = basics + rate_laws
 
-    def _mass_action_ratelaw(self, name: str, reactants: List[Species], products: List[Species],
-                             reversible: bool):
+    def _mass_action_ratelaw(self, name: str, reactants: Sequence[Species],
+                             products: Sequence[Species], reversible: bool):
         '''Generate a mass-action rate law string from a reaction.'''
 
-        def species_list_str(species_list: List[Species]):
+        def species_list_str(species_list: Sequence[Species]):
             if not species_list:
                 return ''
             toks = list()
@@ -0,0 +1,193 @@
+'''Functions that compile an Antimony tree into a flat program of symbol table operations.
+
+Rather than having the analyzer dispatch on node types every time it walks the tree, the tree is
+walked once and each statement is translated into a list of simple operations (opcode followed
+by arguments) on the symbol table. The program is cached on the FileNode, so analyzing the same
+tree again amounts to iterating over a list.
+'''
+
+from stibium.ant_types import (Annotation, Assignment, Declaration, ErrorNode, ErrorToken,
+                               FileNode, InComp, Name, Reaction, SimpleStmt, Species, TreeNode,
+                               TrunkNode)
+from stibium.symbols import BASE_SCOPE, AbstractScope, QName, SymbolTable
+from stibium.types import SymbolType
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, cast
+
+
+Program = List[Tuple[Any, ...]]
+
+# (OP_INSERT, qname, typ, decl_node, value_node); see SymbolTable.insert()
+OP_INSERT = 0
+# (OP_ANNOTATE, qname, annotation); see SymbolTable.insert_annotation()
+OP_ANNOTATE = 1
+# (OP_INSERT_MANY, scope, [(name, typ, decl_node, value_node), ...]); see SymbolTable.insert_many()
+OP_INSERT_MANY = 2
+
+# Indexed by opcode
+_DISPATCH = (
+    SymbolTable.insert,
+    SymbolTable.insert_annotation,
+    SymbolTable.insert_many,
+)
+
+
+def compile_file(root: FileNode) -> Program:
+    '''Return the program for the given tree, compiling it if that has not been done yet.'''
+    if root.program is None:
+        root.program = _compile_file(root)
+    return root.program
+
+
+def run_program(table: SymbolTable, program: Program):
+    '''Execute the operations of a program on the given symbol table, in order.'''
+    dispatch = _DISPATCH
+    for op, *args in program:
+        dispatch[op](table, *args)
+
+
+def _compile_file(root: FileNode) -> Program:
+    program: Program = list()
+    base_scope = BASE_SCOPE
+    stmt_compilers = _STMT_COMPILERS
+    for child in root.children:
+        if isinstance(child, (ErrorToken, ErrorNode)):
+            continue
+
+        if isinstance(child, SimpleStmt):
+            stmt = child.get_stmt()
+            if stmt is None:
+                # empty statement
+                continue
+
+            compile_stmt = stmt_compilers.get(type(stmt))
+            if compile_stmt is not None:
+                compile_stmt(program, base_scope, stmt)
+
+    return program
+
+
+def compile_incomps(program: Program, scope: AbstractScope, incomps: Iterable[Optional[InComp]]):
+    '''Record the compartment names of the given `incomp` nodes, skipping the None ones.
+
+    According to the grammar, an `incomp` may only appear in a NameMaybeIn or at the end of a
+    reaction, so the statement compilers pick them out directly instead of searching the tree.
+    They are recorded after the rest of the statement.
+    '''
+    for incomp in incomps:
+        if incomp is not None:
+            program.append((OP_INSERT, QName(scope, incomp.get_comp().get_name()),
+                            SymbolType.Compartment, None, None))
+
+
+def compile_arith_expr(program: Program, scope: AbstractScope, expr: TreeNode):
+    # TODO handle dummy tokens
+    _Name = Name
+    # hasattr() is used rather than isinstance() since the latter is much slower
+    if not hasattr(expr, 'children'):
+        if type(expr) is _Name:
+            leaf = cast(Name, expr)
+            program.append((OP_INSERT, QName(scope, leaf), SymbolType.Parameter, None, None))
+    else:
+        expr = cast(TrunkNode, expr)
+        param = SymbolType.Parameter
+        items = [(leaf, param, None, None) for leaf in _collect_names(expr)]
+        if items:
+            program.append((OP_INSERT_MANY, scope, items))
+
+
+def _collect_names(expr: TrunkNode) -> List[Name]:
+    # Return the Name leaves under expr, in order. This is a single loop over an explicit stack
+    # rather than a filter over scan_leaves(), since that's the bulk of the work in compiling a
+    # rate-law-heavy file.
+    _Name = Name
+    names = list()
+    stack: List[Optional[TreeNode]] = [expr]
+    while stack:
+        node = stack.pop()
+        children = getattr(node, 'children', None)
+        if children is None:
+            # a leaf or a None placeholder
+            if type(node) is _Name:
+                names.append(node)
+        else:
+            stack.extend(reversed(children))
+    return names
+
+
+def compile_reaction(program: Program, scope: AbstractScope, reaction: Reaction):
+    name = reaction.get_name()
+    if name is not None:
+        program.append((OP_INSERT, QName(scope, name), SymbolType.Reaction, reaction, None))
+
+    # Go through the children of the species lists directly rather than through
+    # get_reactants()/get_products(), to avoid creating intermediate lists
+    species_type = SymbolType.Species
+    items = list()
+    for slist in (reaction.get_reactant_list(), reaction.get_product_list()):
+        if slist is None:
+            continue
+        # species are every other child; the ones in between are '+' operators
+        children = slist.children
+        for i in range(0, len(children), 2):
+            items.append((cast(Species, children[i]).get_name(), species_type, None, None))
+    if items:
+        program.append((OP_INSERT_MANY, scope, items))
+
+    compile_arith_expr(program, scope, reaction.get_rate_law())
+
+    reaction_name = reaction.children[0]
+    compile_incomps(program, scope, (
+        reaction_name.get_maybein().get_incomp() if reaction_name is not None else None,
+        reaction.get_incomp(),
+    ))
+
+
+def compile_assignment(program: Program, scope: AbstractScope, assignment: Assignment):
+    program.append((OP_INSERT, QName(scope, assignment.get_name()), SymbolType.Parameter, None,
+                    assignment))
+    compile_arith_expr(program, scope, assignment.get_value())
+    compile_incomps(program, scope, (assignment.get_maybein().get_incomp(),))
+
+
+def compile_declaration(program: Program, scope: AbstractScope, declaration: Declaration):
+    # TODO add modifiers in table
+    modifiers = declaration.get_modifiers()
+    # TODO deal with variability
+    variab = modifiers.get_variab()
+    stype = modifiers.get_type()
+
+    # Skip comma separators
+    items = declaration.get_items()
+    for item in items:
+        name = item.get_name()
+        value = item.get_value()
+
+        # TODO update variability
+        # If there is value assignment (value is not None), then record the declaration item
+        # as the value node. Otherwise put None. See that we can't directly put "value" as
+        # argument "valud_node" since they are different things
+        value_node = item if value else None
+        program.append((OP_INSERT, QName(scope, name), stype, declaration, value_node))
+        if value:
+            compile_arith_expr(program, scope, value)
+
+    compile_incomps(program, scope, [item.get_maybein().get_incomp() for item in items])
+
+
+def compile_annotation(program: Program, scope: AbstractScope, annotation: Annotation):
+    name = annotation.get_name()
+    # TODO(Gary) maybe we can have a narrower type here, since annotation is restricted only to
+    # species or compartments? I'm not sure. If that's the case though, we'll need union types.
+    qname = QName(scope, name)
+    program.append((OP_INSERT, qname, SymbolType.Parameter, None, None))
+    program.append((OP_ANNOTATE, qname, annotation))
+
+
+# Maps the type of a statement to the function that compiles it
+_STMT_COMPILERS: Dict[type, Callable[[Program, AbstractScope, Any], None]] = {
+    Reaction: compile_reaction,
+    Assignment: compile_assignment,
+    Declaration: compile_declaration,
+    Annotation: compile_annotation,
+}
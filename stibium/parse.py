@@ -3,7 +3,7 @@
 
 from typing import Union
 from stibium.ant_types import FileNode
-from stibium.tree_builder import set_leaf_pointers, set_parents, transform_tree
+from stibium.tree_builder import transform_tree
 from stibium.types import ASTNode, AntimonySyntaxError, SrcLocation, SrcPosition
 from stibium.utils import get_abs_path, get_token_range
 from .lark_patch import get_puppet
@@ -82,14 +82,10 @@ class AntimonyParser:
             tree.meta.end_column = 1
             tree.meta.empty = False
 
-        # convert from Lark tree to our tree
+        # convert from Lark tree to our tree. This also sets the parent pointers for all nodes,
+        # and the next and prev pointers for all leaves in the tree
         root = transform_tree(tree)
         assert root is not None and isinstance(root, FileNode)
-
-        # set the parent pointers for all nodes in the tree
-        set_parents(root)
-        # set the next and prev pointers for all leaves in the tree
-        set_leaf_pointers(root)
         return root
 
     def _parse_with_puppet(self, puppet, recoverable: bool, text: str, token_callback = None):
@@ -6,9 +6,10 @@ from stibium.ant_types import Annotation, Name, TreeNode
 from .types import ObscuredDeclaration, ObscuredValue, SrcRange, SymbolType, IncompatibleType
 
 import abc
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 from dataclasses import dataclass
-from typing import DefaultDict, Dict, List, Optional, Set, Tuple, Union
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 from lark.lexer import Token
 
 from lark.tree import Tree
@@ -16,12 +17,18 @@ from lark.tree import Tree
 '''Classes that represent scopes.'''
 
 class AbstractScope(abc.ABC):
-    '''Should never be instantiated.'''
-    pass
+    '''Should never be instantiated.
+
+    Scopes are hashed on every symbol table lookup, so subclasses compute their hash up front.
+    '''
+    __slots__ = ()
 
 
 class BaseScope(AbstractScope):
     '''The highest-level scope within a file, outside of any declared models.'''
+    __slots__ = ()
+    _HASH = hash(('_base', ''))
+
     def __init__(self):
         pass
 
@@ -32,42 +39,70 @@ class BaseScope(AbstractScope):
         return True
 
     def __hash__(self):
-        return hash(('_base', ''))
+        return self._HASH
 
 
 class ModelScope(AbstractScope):
-    '''The scope for statements in declared models.'''
+    '''The scope for statements in declared models. See also model_scope().'''
+    __slots__ = ('name', '_hash')
+
     def __init__(self, name: str):
         self.name = name
+        self._hash = hash(('model', name))
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, ModelScope):
             return NotImplemented
         
         return self.name == other.name
 
     def __hash__(self):
-        return hash(('model', self.name))
+        return self._hash
 
 
 class FunctionScope(AbstractScope):
-    '''The scope for statements in functions.'''
+    '''The scope for statements in functions. See also function_scope().'''
+    __slots__ = ('name', '_hash')
+
     def __init__(self, name: str):
         self.name = name
+        self._hash = hash(('function', name))
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, FunctionScope):
             return NotImplemented
 
         return self.name == other.name
 
     def __hash__(self):
-        return hash(('function', self.name))
+        return self._hash
+
+
+# BaseScope has no state, so one instance is shared by everyone
+BASE_SCOPE = BaseScope()
+
+
+@lru_cache(maxsize=256)
+def model_scope(name: str) -> ModelScope:
+    '''Return the (shared) ModelScope for the given model name.'''
+    return ModelScope(name)
+
+
+@lru_cache(maxsize=256)
+def function_scope(name: str) -> FunctionScope:
+    '''Return the (shared) FunctionScope for the given function name.'''
+    return FunctionScope(name)
 
 
 @dataclass
 class QName:
     '''Represents a qualified name; i.e. a scope and a name string.'''
+    # fields have no defaults, so this works with a regular dataclass
+    __slots__ = ('scope', 'name')
     scope: AbstractScope
     name: Name
 
@@ -83,6 +118,8 @@ class Symbol:
         dcl_node:       The analysis Node that represents the declaration statement of the symbol. May
                         be None if the symbol was not explicitly declared.
     '''
+    __slots__ = ('name', 'type', 'type_name', 'decl_name', 'decl_node', 'value_node', 'annotations',
+                 '_def_name', '_help_str')
 
     name: str
     type: SymbolType
@@ -91,11 +128,15 @@ class Symbol:
     decl_node: Optional[TreeNode]
     value_node: Optional[TreeNode]
     annotations: List[Annotation]
+    # Cached results of def_name() and help_str(); the symbol table resets them to None whenever
+    # it modifies the attributes they are computed from
+    _def_name: Optional[TreeNode]
+    _help_str: Optional[str]
 
     def __init__(self, name: str, typ: SymbolType, type_name: Name,
-            decl_name: Name = None,
-            decl_node: TreeNode = None,
-            value_node: TreeNode = None):
+            decl_name: Optional[Name] = None,
+            decl_node: Optional[TreeNode] = None,
+            value_node: Optional[TreeNode] = None):
         self.name = name
         self.type = typ
         self.type_name = type_name
@@ -103,19 +144,26 @@ class Symbol:
         self.decl_node = decl_node
         self.value_node = value_node
         self.annotations = list()
+        self._def_name = None
+        self._help_str = None
 
     def def_name(self):
         '''Return the Name that should be considered as the definition'''
-        return self.decl_name or self.value_node or self.type_name
+        if self._def_name is None:
+            self._def_name = self.decl_name or self.value_node or self.type_name
+        return self._def_name
 
     def help_str(self):
         '''Generate a markdown help string for this symbol.'''
+        if self._help_str is not None:
+            return self._help_str
         # TODO this is very basic right now. Need to create new Symbol classes for specific types
         # and get better data displayed here.
         ret = '```\n({}) {}\n```'.format(self.type, self.name)
         if self.annotations:
             # add the first annotation
             ret += '\n\n***\n\n{}'.format(self.annotations[0].get_uri())
+        self._help_str = ret
         return ret
 
 
@@ -124,22 +172,38 @@ class VarSymbol(Symbol):
     
     TODO account for variability
     '''
+    __slots__ = ()
+
+
+# How a new type relates to the existing type of a symbol, for SymbolTable._insert(): 0 if they
+# are the same, 1 if the new type is narrower, and -1 if it is broader. Incompatible pairs are
+# absent.
+_REL: Dict[Tuple[SymbolType, SymbolType], int] = dict()
+for _new in SymbolType:
+    for _old in SymbolType:
+        if _new == _old:
+            _REL[(_new, _old)] = 0
+        elif _new.derives_from(_old):
+            _REL[(_new, _old)] = 1
+        elif _old.derives_from(_new):
+            _REL[(_new, _old)] = -1
+del _new, _old
 
 
 # TODO allow the same scope and name to map to multiple symbols, since antimony allows
 # models and variables to have the same name
 class SymbolTable:
     # In the future, maybe use a tree-like data structure? Probably not necessary though - Gary.
-    _table: DefaultDict[AbstractScope, Dict[str, Symbol]]
-    _qnames: List[QName]
+    # Keyed by (scope, name), so that each access is a single lookup
+    _table: Dict[Tuple[AbstractScope, str], Symbol]
+    # First number suffix that may be free for each (scope, prefix) pair in get_unique_name(). The
+    # scope is None for names that are unique in every scope.
+    _next_suffix: Dict[Tuple[Optional[AbstractScope], str], int]
 
     def __init__(self):
-        self._table = defaultdict(dict)
+        self._table = dict()
         self._issues = list()
-        self._qnames = list()
-
-    def _leaf_table(self, scope: AbstractScope):
-        return self._table[scope]
+        self._next_suffix = dict()
 
     @property
     def issues(self):
@@ -147,48 +211,47 @@ class SymbolTable:
 
     def get_all_names(self):
         '''Get all the unique names in the table as a set (outside of scope) '''
-        names = set()
-        for leaf_table in self._table.values():
-            names |= leaf_table.keys()
-        return names
+        return {name for _, name in self._table}
 
-    def get_all_qnames(self):
-        '''Get all the unique names in the table as a set (outside of scope) '''
-        return self._qnames
+    def get_all_qnames(self) -> List[QName]:
+        '''Get a QName for each symbol in the table, in the order they were first inserted.'''
+        return [QName(scope, sym.type_name) for (scope, _), sym in self._table.items()]
 
-    def get_unique_name(self, prefix: str, scope: AbstractScope = None) -> str:
+    def get_unique_name(self, prefix: str, scope: Optional[AbstractScope] = None) -> str:
         '''Obtain a unique name under the scope by trying successively larger number suffixes.
         
-        If scope is None, then find a name unique in every scope.
+        If scope is None, then find a name unique in every scope. The search starts at the suffix
+        returned by the last call with the same prefix and scope, since the suffixes before it are
+        known to be taken.
         '''
+        key = (scope, prefix)
+        i = self._next_suffix.get(key, 0)
         if scope is None:
             all_names = self.get_all_names()
 
-            i = 0
             while True:
-                name = '{}{}'.format(prefix, i)
+                name = f'{prefix}{i}'
                 if name not in all_names:
                     break
                 i += 1
         else:
-            leaf_table = self._leaf_table(scope)
-            i = 0
+            table = self._table
             while True:
-                name = '{}{}'.format(prefix, i)
-                if name not in leaf_table:
+                name = f'{prefix}{i}'
+                if (scope, name) not in table:
                     break
                 i += 1
+        self._next_suffix[key] = i
         return name
 
     def get(self, qname: QName) -> List[Symbol]:
-        leaf_table = self._leaf_table(qname.scope)
-        name = qname.name.text
-        if name in leaf_table:
-            return [leaf_table[name]]
+        sym = self._table.get((qname.scope, qname.name.text))
+        if sym is not None:
+            return [sym]
         return []
 
-    def insert(self, qname: QName, typ: SymbolType, decl_node: TreeNode = None,
-               value_node: TreeNode = None):
+    def insert(self, qname: QName, typ: SymbolType, decl_node: Optional[TreeNode] = None,
+               value_node: Optional[TreeNode] = None):
         '''Insert a variable symbol into the symbol table.
 
         This should be called repeatedly in the order that the symbols were defined. Additional
@@ -206,31 +269,53 @@ class SymbolTable:
         # create more specific symbols. Need to store things like value for types like var.
         # Have an inner method that returns (added, [errors]). Update the value, etc. only if
         # successfully added.
-        assert qname.name is not None
-        self._qnames.append(qname)
+        name_node = qname.name
+        assert name_node is not None
+        self._insert(qname.scope, name_node, typ, decl_node, value_node)
+
+    def insert_many(self, scope: AbstractScope,
+                    items: Iterable[Tuple[Name, SymbolType, Optional[TreeNode], Optional[TreeNode]]]):
+        '''Insert multiple variable symbols under the same scope.
+
+        This is equivalent to calling insert() on each item in order, but avoids creating a QName
+        for each of them.
 
-        leaf_table = self._leaf_table(qname.scope)
-        name = qname.name.text
-        if name not in leaf_table:
+        Args:
+            scope: The scope of all the symbols.
+            items: (name, typ, decl_node, value_node) tuples, where name is the Name of the symbol
+                   and the rest are as in insert().
+        '''
+        insert = self._insert
+        for name_node, typ, decl_node, value_node in items:
+            assert name_node is not None
+            insert(scope, name_node, typ, decl_node, value_node)
+
+    def _insert(self, scope: AbstractScope, name_node: Name, typ: SymbolType,
+                decl_node: Optional[TreeNode], value_node: Optional[TreeNode]):
+        # See insert()
+        name = name_node.text
+        key = (scope, name)
+        sym: Optional[Symbol] = self._table.get(key)
+        if sym is None:
             # TODO use a different Symbol class for other symbols
-            sym = VarSymbol(name, typ, qname.name)
-            leaf_table[name] = sym
+            sym = VarSymbol(name, typ, name_node)
+            self._table[key] = sym
         else:
-            sym = leaf_table[name]
             old_type = sym.type
+            rel = _REL.get((typ, old_type))
 
-            if typ.derives_from(old_type):
-                # new type is valid and narrower
-                sym.type = typ
-                sym.type_name = qname.name
-            elif old_type.derives_from(typ):
-                # legal, but useless information
-                pass
-            else:
+            if rel is None:
                 old_range = sym.type_name.range
-                new_range = qname.name.range
+                new_range = name_node.range
                 self._issues.append(IncompatibleType(old_type, old_range, typ, new_range))
                 return
+            elif rel >= 0:
+                # new type is valid and narrower (or the same)
+                sym.type = typ
+                sym.type_name = name_node
+                sym._def_name = None
+                sym._help_str = None
+            # otherwise, it's legal, but useless information
 
         # TODO improve decl_name/decl_node behavior
         # Overriding declaration should generally be
@@ -241,7 +326,7 @@ class SymbolTable:
         # right now. Consider "const a; species a"
         # Override the declaration
         if decl_node is not None:
-            decl_name = qname.name
+            decl_name = name_node
             if sym.decl_name is not None:
                 old_range = sym.decl_name.range
                 new_range = decl_name.range
@@ -249,23 +334,26 @@ class SymbolTable:
                 # issues.append(ObscuredDeclaration(old_range, new_range, decl_name.text))
             sym.decl_node = decl_node
             sym.decl_name = decl_name
+            sym._def_name = None
 
         if value_node is not None:
-            value_name = qname.name
+            value_name = name_node
             if sym.value_node is not None:
                 old_range = sym.value_node.range
                 new_range = value_node.range
                 # Overriding previous declaration
                 self._issues.append(ObscuredValue(old_range, new_range, value_name.text))
             sym.value_node = value_node
+            sym._def_name = None
 
     def insert_annotation(self, qname: QName, node: Annotation):
         '''Insert an Annotation for a symbol.'''
-        leaf_table = self._leaf_table(qname.scope)
-        name = qname.name.text
-        if name not in leaf_table:
-            sym = VarSymbol(name, SymbolType.Unknown, qname.name)
-            leaf_table[name] = sym
-        else:
-            sym = leaf_table[name]
+        name_node = qname.name
+        name = name_node.text
+        key = (qname.scope, name)
+        sym = self._table.get(key)
+        if sym is None:
+            sym = VarSymbol(name, SymbolType.Unknown, name_node)
+            self._table[key] = sym
         sym.annotations.append(node)
+        sym._help_str = None
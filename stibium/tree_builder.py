@@ -7,7 +7,8 @@ Author: Gary Geng
 
 # Helper classes to hold name structures
 
-from typing import Callable, Dict, Optional, Type, TypeVar, Union, cast
+import sys
+from typing import Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union, cast
 
 from lark.lexer import Token
 from lark.tree import Tree
@@ -72,69 +73,176 @@ for name in KEYWORDS:
     TREE_MAP[name] = Keyword
 
 
-def transform_tree(tree: Optional[Union[Tree, str]]):
-    '''Transform the entirely of a Lark tree to our Antimony tree and return it.'''
-    if tree is None:
-        return None
+# The children of a trunk, typed as the concrete node classes, whose parent and sibling index can
+# be assigned (TreeNode itself has no slots for them)
+_Children = Tuple[Optional[Union[TrunkNode, LeafNode]], ...]
+
+
+def _build_leaf(cls: Type[LeafNode]) -> Callable[[Token], LeafNode]:
+    def build(token: Token) -> LeafNode:
+        return cls(get_token_range(token), token.value)  # type: ignore
+    return build
 
-    if isinstance(tree, str):
-        # assert isinstance(tree, Token)
-        tree = cast(Token, tree)
-        cls = TREE_MAP[tree.type]
 
-        # assert issubclass(cls, LeafNode)
-        return cls(get_token_range(tree), tree.value)  # type: ignore
+def _build_name(token: Token) -> LeafNode:
+    # names are used as keys in the symbol table and repeat often; intern them so that comparing
+    # them is mostly a pointer comparison
+    return Name(get_token_range(token), sys.intern(token.value))
+
+
+def _build_decl_modifiers(range_: SrcRange, children: tuple) -> TrunkNode:
+    return DeclModifiers(range_, _decl_modifiers_children(children))
+
+
+# Functions that build the node for each token type and each rule, derived from TREE_MAP. The trunk
+# builders take the range and the (already built) children of the node.
+_LEAF_BUILDERS: Dict[str, Callable[[Token], LeafNode]] = dict()
+_BUILDERS: Dict[str, Callable[[SrcRange, tuple], TrunkNode]] = dict()
+for name, cls in TREE_MAP.items():
+    if cls is Name:
+        _LEAF_BUILDERS[name] = _build_name
+    elif cls is DeclModifiers:
+        _BUILDERS[name] = _build_decl_modifiers
+    elif issubclass(cls, LeafNode):
+        _LEAF_BUILDERS[name] = _build_leaf(cls)
     else:
-        cls = TREE_MAP[tree.data]
-        # assert issubclass(cls, TrunkNode)
+        _BUILDERS[name] = cls  # type: ignore
+
 
-        children = tuple(transform_tree(child) for child in tree.children)
+def transform_tree(tree: Optional[Union[Tree, str]]):
+    '''Transform the entirely of a Lark tree to our Antimony tree and return it.
 
-        # special handling for DeclModifiers. For consistency, we always store two children, even
-        # if one of them is None.
-        if cls is DeclModifiers:
-            var_mod = None
-            type_mod = None
-            for child in children:
-                if isinstance(child, VarModifier):
-                    var_mod = child
-                else:
-                    # assert isinstance(child, TypeModifier)
-                    child = cast(TypeModifier, child)
-                    type_mod = child
-            children = (var_mod, type_mod)
+    The parent pointers of all nodes, as well as the 'next' and 'prev' pointers of all leaves, are
+    set in the same pass, so there is no need to call set_parents() or set_leaf_pointers() on the
+    result.
+    '''
+    if tree is None:
+        return None
 
-        return cls(get_tree_range(tree), children)  # type: ignore
+    # This is done iteratively rather than recursively, to avoid a Python call per node and
+    # hitting the recursion limit on large files. First, list all the nodes in pre-order; each
+    # node is pushed before its children, and the children are pushed in order, so that reversing
+    # the list gives a left-to-right post-order.
+    # Tokens are the majority of nodes, so they are told apart with a type() identity check,
+    # which is cheaper than isinstance()
+    _Token = Token
+    order: List[Optional[Union[Tree, str]]] = list()
+    work: List[Optional[Union[Tree, str]]] = [tree]
+    while work:
+        node = work.pop()
+        order.append(node)
+        if node is not None and type(node) is not _Token:
+            work.extend(cast(Tree, node).children)
+
+    # Bind globals used for every node to locals
+    leaf_builders = _LEAF_BUILDERS
+    builders = _BUILDERS
+    _get_tree_range = get_tree_range
+
+    # Then build our nodes bottom-up. When a Tree is reached, its transformed children are the
+    # last entries in `built`. Since leaves are built in order, they are linked as they are built.
+    built: List[Optional[TreeNode]] = list()
+    append = built.append
+    last_leaf: Optional[LeafNode] = None
+    for node in reversed(order):
+        if type(node) is _Token:
+            token = cast(Token, node)
+            leaf = leaf_builders[token.type](token)
+            leaf.prev = last_leaf
+            if last_leaf is not None:
+                last_leaf.next = leaf
+            last_leaf = leaf
+            append(leaf)
+        elif node is None:
+            append(None)
+        else:
+            node = cast(Tree, node)
+            # Most nodes have one or two children; pop those directly rather than copying a slice
+            n_children = len(node.children)
+            children: tuple
+            if n_children == 1:
+                children = (built.pop(),)
+            elif n_children == 2:
+                second = built.pop()
+                children = (built.pop(), second)
+            elif n_children:
+                children = tuple(built[-n_children:])
+                del built[-n_children:]
+            else:
+                children = ()
+
+            trunk = builders[node.data](_get_tree_range(node), children)
+            for index, child in enumerate(cast(_Children, trunk.children)):
+                if child is not None:
+                    child.parent = trunk
+                    child._sibling_index = index
+            append(trunk)
+
+    assert len(built) == 1
+    return built[0]
+
+
+def _decl_modifiers_children(children: tuple):
+    '''Return the children of a DeclModifiers node as (var_mod, type_mod).
+
+    For consistency, DeclModifiers always stores two children, even if one of them is None.
+    '''
+    var_mod = None
+    type_mod = None
+    for child in children:
+        if isinstance(child, VarModifier):
+            var_mod = child
+        else:
+            # assert isinstance(child, TypeModifier)
+            child = cast(TypeModifier, child)
+            type_mod = child
+    return (var_mod, type_mod)
 
 
 def set_parents(root: TreeNode):
-    '''Set the parent pointer of all nodes in the tree. The tree is modified in-place'''
-    if isinstance(root, LeafNode):
-        return
+    '''Set the parent pointer of all nodes in the tree. The tree is modified in-place
 
-    assert isinstance(root, TrunkNode)
-    for child in root.children:
-        if child:
-            child.parent = root
-            set_parents(child)
+    The index of each node among its siblings is recorded as well, for next_sibling().
+    '''
+    # explicit stack rather than recursion, to avoid a Python call per node
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, LeafNode):
+            continue
+
+        assert isinstance(node, TrunkNode)
+        for index, child in enumerate(cast(_Children, node.children)):
+            if child:
+                child.parent = node
+                child._sibling_index = index
+                stack.append(child)
 
 
 def set_leaf_pointers(root: Optional[TreeNode], last: Optional[LeafNode] = None):
     '''Set 'next' and 'prev' of leaf nodes so that all the leaf nodes are linked in order.
+
+    The first leaf is linked to `last`, if given. Return the last leaf of the tree (or `last` if
+    the tree has no leaves).
     '''
     if root is None:
         return None
 
-    if isinstance(root, LeafNode):
-        root.prev = last
-        if last:
-            last.next = root
-        return root
-
-    assert isinstance(root, TrunkNode)
-
-    for child in root.children:
-        # If last node is None, then keep the current last
-        last = set_leaf_pointers(child, last) or last
+    # explicit stack rather than recursion; children are pushed in reverse so that leaves are
+    # visited in order
+    stack: List[Optional[TreeNode]] = [root]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+
+        if isinstance(node, LeafNode):
+            node.prev = last
+            if last:
+                last.next = node
+            last = node
+        else:
+            assert isinstance(node, TrunkNode)
+            stack.extend(reversed(node.children))
 
     return last
@@ -5,7 +5,7 @@ Author: Gary Geng
 
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Union
+from typing import Dict, FrozenSet, Optional, Tuple, Union
 
 from lark.lexer import Token
 from lark.tree import Tree
@@ -21,6 +21,22 @@ class SrcPosition:
         self.line = line
         self.column = column
 
+    @classmethod
+    def get(cls, line: int, column: int) -> 'SrcPosition':
+        '''Return a shared SrcPosition for the given line and column.
+
+        The same position tends to be the start or end of many tokens and nodes, so instances are
+        interned. They must not be modified.
+        '''
+        key = (line, column)
+        pos = _POS_CACHE.get(key)
+        if pos is None:
+            if len(_POS_CACHE) >= _POS_CACHE_SIZE:
+                _POS_CACHE.clear()
+            pos = cls(line, column)
+            _POS_CACHE[key] = pos
+        return pos
+
     def __repr__(self):
         return '{}:{}'.format(self.line, self.column)
 
@@ -59,7 +75,12 @@ class SrcPosition:
         if self.line == other.line:
             return self.column < other.column
         return False
-        
+
+
+# Interned positions; see SrcPosition.get(). The cache is cleared when it reaches the size limit
+_POS_CACHE: Dict[Tuple[int, int], SrcPosition] = dict()
+_POS_CACHE_SIZE = 4096
+
 
 class SrcRange:
     '''A range in text; uses 1-based index.
@@ -106,6 +127,8 @@ class IssueSeverity(Enum):
 
 
 class Issue:
+    __slots__ = ('range', 'message', 'severity')
+
     def __init__(self, range_: SrcRange, severity: IssueSeverity):
         self.range = range_
         self.message = ''
@@ -120,10 +143,12 @@ class Issue:
 
 
 class SyntaxErrorIssue(Issue):
-    pass
+    __slots__ = ()
 
 
 class UnexpectedTokenIssue(SyntaxErrorIssue):
+    __slots__ = ()
+
     def __init__(self, leaf_range: SrcRange, leaf_name: str):
         super().__init__(leaf_range, IssueSeverity.Error)
         self.message = "Unexpected token '{name}'".format(name=leaf_name)
@@ -131,6 +156,8 @@ class UnexpectedTokenIssue(SyntaxErrorIssue):
 
 class UnexpectedEOFIssue(SyntaxErrorIssue):
     '''Unexpected newline or EOF when we expected another token.'''
+    __slots__ = ()
+
     def __init__(self, last_leaf_range: SrcRange):
         super().__init__(last_leaf_range, IssueSeverity.Error)
         self.message = "Expected a token"
@@ -138,6 +165,8 @@ class UnexpectedEOFIssue(SyntaxErrorIssue):
 
 class UnexpectedNewlineIssue(SyntaxErrorIssue):
     '''Unexpected newline or EOF when we expected another token.'''
+    __slots__ = ()
+
     def __init__(self, leaf_pos: SrcPosition):
         leaf_range = SrcRange(leaf_pos, SrcPosition(leaf_pos.line + 1, 1))
         super().__init__(leaf_range, IssueSeverity.Error)
@@ -145,6 +174,8 @@ class UnexpectedNewlineIssue(SyntaxErrorIssue):
 
 
 class IncompatibleType(Issue):
+    __slots__ = ('old_type', 'old_range', 'new_type', 'new_range')
+
     def __init__(self, old_type, old_range, new_type, new_range):
         super().__init__(new_range, IssueSeverity.Error)
         self.old_type = old_type
@@ -161,6 +192,8 @@ class IncompatibleType(Issue):
 
 
 class ObscuredDeclaration(Issue):
+    __slots__ = ('old_range', 'new_range', 'name')
+
     def __init__(self, old_range: SrcRange, new_range: SrcRange, name: str):
         super().__init__(old_range, IssueSeverity.Warning)
         self.old_range = old_range
@@ -175,6 +208,8 @@ class ObscuredDeclaration(Issue):
 
 
 class ObscuredValue(Issue):
+    __slots__ = ('old_range', 'new_range', 'name')
+
     def __init__(self, old_range: SrcRange, new_range: SrcRange, name: str):
         super().__init__(old_range, IssueSeverity.Warning)
         self.old_range = old_range
@@ -191,7 +226,7 @@ class ObscuredValue(Issue):
 class AntimonySyntaxError(Exception):
     # TODO this is far from complete. To include: filename, possible token choices,
     # and possibly even parser state?
-    def __init__(self, text: str, pos: SrcPosition, end_pos: SrcPosition=None):
+    def __init__(self, text: str, pos: SrcPosition, end_pos: Optional[SrcPosition] = None):
         message = f"unexpected token '{text}' at {pos}"
         super().__init__(message)
         self.text = text
@@ -223,23 +258,33 @@ class SymbolType(Enum):
         return self.value
 
     def derives_from(self, other):
-        if self == other:
-            return True
+        return (self, other) in _DERIVES
 
-        if other == SymbolType.Unknown:
-            return True
 
-        derives_from_param = self in (SymbolType.Species, SymbolType.Compartment,
-                                      SymbolType.Reaction,
-                                      SymbolType.Constraint)
+def _derives_from(typ: SymbolType, other: SymbolType):
+    # The relation behind SymbolType.derives_from(), which is looked up from _DERIVES instead
+    if typ == other:
+        return True
 
-        if other == SymbolType.Variable:
-            return derives_from_param or self == SymbolType.Parameter
+    if other == SymbolType.Unknown:
+        return True
 
-        if other == SymbolType.Parameter:
-            return derives_from_param
+    derives_from_param = typ in (SymbolType.Species, SymbolType.Compartment,
+                                 SymbolType.Reaction,
+                                 SymbolType.Constraint)
 
-        return False
+    if other == SymbolType.Variable:
+        return derives_from_param or typ == SymbolType.Parameter
+
+    if other == SymbolType.Parameter:
+        return derives_from_param
+
+    return False
+
+
+# All the (typ, other) pairs for which typ.derives_from(other) is True
+_DERIVES: FrozenSet[Tuple[SymbolType, SymbolType]] = frozenset(
+    (typ, other) for typ in SymbolType for other in SymbolType if _derives_from(typ, other))
 
 
 class Variability(Enum):
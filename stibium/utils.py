@@ -22,13 +22,14 @@ def get_abs_path(filename: str):
 
 def get_token_range(token: Token):
     '''Get the range of a Lark Token as SrcRange.'''
-    return SrcRange(SrcPosition(token.line, token.column),
-                    SrcPosition(token.end_line, token.end_column))
+    return SrcRange(SrcPosition.get(token.line, token.column),
+                    SrcPosition.get(token.end_line, token.end_column))
 
 def get_tree_range(tree: Tree):
     '''Get the range of a Lark Tree as SrcRange.'''
-    return SrcRange(SrcPosition(tree.meta.line, tree.meta.column),
-                    SrcPosition(tree.meta.end_line, tree.meta.end_column))
+    meta = tree.meta
+    return SrcRange(SrcPosition.get(meta.line, meta.column),
+                    SrcPosition.get(meta.end_line, meta.end_column))
 
 
 def formatted_code(node: Optional[TreeNode]):
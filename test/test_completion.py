@@ -84,3 +84,12 @@ def test_mass_action(code: str, pos: SrcPosition, text_comps: List[str], snippet
     assert actual_texts == text_comps
     assert actual_snippets == snippet_comps
 
+
+
+def test_repeated_mass_action():
+    # generating a name for an anonymous reaction must not use it up
+    antfile = AntFile('', 'J0: A -> B; k\n -> C; ')
+    for _ in range(3):
+        actual = antfile.completions(SrcPosition(2, 8))
+        snippets = [x.text for x in actual if x.kind == AntCompletionKind.RATE_LAW]
+        assert snippets == ['${1:k_f_J1} - ${2:k_b_J1} * C']
@@ -1,6 +1,7 @@
 
 
 from typing import Tuple
+from stibium.analysis import AntTreeAnalyzer
 from stibium.api import AntFile
 from stibium.types import IncompatibleType, ObscuredValue, SrcPosition, SrcRange, UnexpectedEOFIssue, UnexpectedNewlineIssue, UnexpectedTokenIssue
 
@@ -90,3 +91,23 @@ def test_obscured_value():
     # the range is that of the second full assignment, or the new_range of the first issue
     assert issues[1].old_range == issues[1].range == issues[0].new_range
     assert issues[1].new_range == SrcRange(SrcPosition(1, 25), SrcPosition(1, 34))
+
+
+def test_reanalyze_same_tree():
+    antfile = AntFile('', 'species a1\ncompartment a1\nJ0: a1 -> b; k * c')
+    program = antfile.tree.program
+    assert program is not None
+
+    # the compiled program is reused and produces the same results
+    analyzer = AntTreeAnalyzer(antfile.tree)
+    assert antfile.tree.program is program
+    assert [repr(issue) for issue in analyzer.get_issues()] == \
+        [repr(issue) for issue in antfile.get_issues()]
+    assert analyzer.get_all_names() == antfile.analyzer.get_all_names() == {'a1', 'b', 'c', 'k', 'J0'}
+
+
+def test_deeply_nested_expression():
+    # building and analyzing the tree must not hit the recursion limit
+    antfile = AntFile('', 'a = ' + '(' * 3000 + 'b' + ')' * 3000)
+    assert len(antfile.get_issues()) == 0
+    assert antfile.analyzer.get_all_names() == {'a', 'b'}
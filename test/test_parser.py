@@ -397,3 +397,59 @@ def test_comments(code: str, reconstructed: str):
     tree = parser.parse(code)
     assert formatted_code(tree) == reconstructed
 
+
+
+def test_traversal_order():
+    tree = parser.parse('J0: A + 2B -> C; k * (A - 1)')
+    leaves = list(tree.scan_leaves())
+    # leaves are visited in source order and agree with the leaf linked list
+    assert [leaf.text for leaf in leaves[:-1]] == ['J0', ':', 'A', '+', '2', 'B', '->', 'C', ';',
+                                                    'k', '*', '(', 'A', '-', '1', ')']
+    for leaf, next_leaf in zip(leaves, leaves[1:]):
+        assert leaf.next is next_leaf
+
+    # descendants are visited in pre-order, starting with the node itself
+    descendants = list(tree.descendants())
+    assert descendants[0] is tree
+    assert all(node is not None for node in descendants)
+    assert [node for node in descendants if not hasattr(node, 'children')] == leaves
+    for node in descendants[1:]:
+        assert descendants.index(node.parent) < descendants.index(node)
+
+
+def test_next_sibling():
+    tree = parser.parse('A + B + C -> D; 1')
+    reaction = tree.children[0].get_stmt()
+    assert isinstance(reaction, Reaction)
+    reactants = reaction.get_reactant_list()
+    children = reactants.children
+    for child, expected in zip(children, children[1:] + (None,)):
+        assert child.next_sibling() is expected
+    assert reaction.next_sibling() is tree.children[0].children[1]
+    assert tree.next_sibling() is None
+
+    # stale index past the end of the new parent's children
+    last = children[-1]
+    last.parent = reaction.get_product_list()
+    assert last.next_sibling() is None
+
+
+@pytest.mark.parametrize('code', [
+    'J0: A + 2B -> C; k * (A - 1)\nspecies a in c; a identity "x"\n  const b = 2, d',
+    'a = 5; ?? b = \nJ1: -> C; k\n',  # with syntax errors
+])
+def test_child_at(code: str):
+    def linear_child_at(node, pos):
+        for child in node.children:
+            if child is not None and child.range.start <= pos < child.range.end:
+                return child
+        return None
+
+    tree = parser.parse(code, recoverable=True)
+    lines = code.split('\n')
+    positions = [SrcPosition(line, column) for line in range(1, len(lines) + 1)
+                 for column in range(1, len(lines[line - 1]) + 2)]
+    for node in tree.descendants():
+        if hasattr(node, 'children'):
+            for pos in positions:
+                assert node.child_at(pos) is linear_child_at(node, pos)
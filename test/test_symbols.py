@@ -0,0 +1,72 @@
+from stibium.ant_types import Name
+from stibium.symbols import BASE_SCOPE, QName, SymbolTable, model_scope
+from stibium.types import IncompatibleType, SrcPosition, SrcRange, SymbolType
+
+
+def make_name(text: str, column: int = 1):
+    return Name(SrcRange(SrcPosition(1, column), SrcPosition(1, column + len(text))), text)
+
+
+def test_insert_many():
+    items = [
+        (make_name('a', 1), SymbolType.Parameter, None, None),
+        (make_name('b', 5), SymbolType.Species, None, None),
+        (make_name('a', 9), SymbolType.Species, None, None),
+        (make_name('b', 13), SymbolType.Compartment, None, None),
+    ]
+
+    table = SymbolTable()
+    for name, typ, decl_node, value_node in items:
+        table.insert(QName(BASE_SCOPE, name), typ, decl_node, value_node)
+
+    batch_table = SymbolTable()
+    batch_table.insert_many(BASE_SCOPE, items)
+
+    for table_ in (table, batch_table):
+        assert table_.get_all_names() == {'a', 'b'}
+        assert table_.get(QName(BASE_SCOPE, make_name('a')))[0].type == SymbolType.Species
+        assert len(table_.issues) == 1
+        assert isinstance(table_.issues[0], IncompatibleType)
+    assert batch_table.issues[0].range == table.issues[0].range
+    assert [qname.name.text for qname in batch_table.get_all_qnames()] == ['a', 'b']
+    assert [qname.name.text for qname in table.get_all_qnames()] == ['a', 'b']
+
+
+def test_get_unique_name():
+    table = SymbolTable()
+    table.insert(QName(BASE_SCOPE, make_name('J0')), SymbolType.Reaction)
+    table.insert(QName(BASE_SCOPE, make_name('J2')), SymbolType.Reaction)
+
+    assert table.get_unique_name('J') == 'J1'
+    # the name is only taken once it is inserted
+    assert table.get_unique_name('J') == 'J1'
+    assert table.get_unique_name('J', BASE_SCOPE) == 'J1'
+    table.insert(QName(BASE_SCOPE, make_name('J1')), SymbolType.Reaction)
+    assert table.get_unique_name('J') == 'J3'
+    assert table.get_unique_name('K') == 'K0'
+
+
+def test_lookup_missing_scope():
+    table = SymbolTable()
+    table.insert(QName(BASE_SCOPE, make_name('a')), SymbolType.Species)
+
+    scope = model_scope('m')
+    assert table.get(QName(scope, make_name('a'))) == []
+    assert table.get_unique_name('a', scope) == 'a0'
+    assert table.get_all_names() == {'a'}
+    assert [qname.scope for qname in table.get_all_qnames()] == [BASE_SCOPE]
+
+
+def test_cached_def_name():
+    table = SymbolTable()
+    name = make_name('a')
+    qname = QName(BASE_SCOPE, name)
+    table.insert(qname, SymbolType.Parameter)
+    sym = table.get(qname)[0]
+    assert sym.def_name() is name
+    assert sym.help_str() == '```\n(parameter) a\n```'
+
+    value_node = make_name('a', 5)
+    table.insert(QName(BASE_SCOPE, make_name('a', 5)), SymbolType.Species, value_node=value_node)
+    assert sym.def_name() is value_node
+    assert sym.help_str() == '```\n(species) a\n```'